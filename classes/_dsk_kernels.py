@@ -0,0 +1,55 @@
+"""
+Hot-loop kernels for the DSK partition writer.
+
+When numba is installed the sliding minimum used for minimizer
+selection runs as a JIT compiled monotonic-deque loop; otherwise a
+vectorized NumPy fallback with the same semantics is used. numba is an
+optional dependency, the fallback keeps results identical.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('numpy module is required. Use pip install numpy')
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+def _window_min_numpy(values, width):
+    """
+    NumPy implementation of the sliding window minimum
+    :param  values: uint64 array of hash values
+    :param  width: window width
+    :return:    array of per-window minimums
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(values, width)
+    return windows.min(axis=1)
+
+
+if HAVE_NUMBA:
+    @njit(cache=True)
+    def _window_min_jit(values, width):
+        n = values.size - width + 1
+        out = np.empty(n, dtype=values.dtype)
+        # monotonic deque of candidate indices, stored in a flat array
+        deque = np.empty(values.size, dtype=np.int64)
+        head = 0
+        tail = 0
+        for i in range(values.size):
+            while tail > head and values[deque[tail - 1]] >= values[i]:
+                tail -= 1
+            deque[tail] = i
+            tail += 1
+            if deque[head] <= i - width:
+                head += 1
+            if i >= width - 1:
+                out[i - width + 1] = values[deque[head]]
+        return out
+
+    window_min = _window_min_jit
+else:
+    window_min = _window_min_numpy
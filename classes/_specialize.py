@@ -0,0 +1,57 @@
+"""
+Per-k specialization of the packing kernel.
+
+Once k is known the 2-bit mask and the reverse-complement shift are
+fixed, so a kernel source with those constants baked in is generated at
+runtime and JIT compiled with numba, letting the backend emit
+straight-line code for the chosen k. Without numba the factory returns
+None and callers keep the generic vectorized path.
+"""
+
+import functools
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('numpy module is required. Use pip install numpy')
+
+from classes._dsk_kernels import HAVE_NUMBA
+
+if HAVE_NUMBA:
+    from numba import njit
+
+
+# rolling 2-bit encoder with the canonical strand selected per window;
+# {k}, {mask} and {shift} are substituted before compilation
+_PACK_SOURCE = '''
+def _pack_line(buf, lut):
+    out = np.empty(buf.size - {k} + 1, dtype=np.uint64)
+    mask = np.uint64({mask})
+    forward = np.uint64(0)
+    reverse = np.uint64(0)
+    for i in range(buf.size):
+        code = np.uint64(lut[buf[i]])
+        forward = ((forward << np.uint64(2)) | code) & mask
+        reverse = ((reverse >> np.uint64(2)) |
+                   ((np.uint64(3) ^ code) << np.uint64({shift})))
+        if i >= {k} - 1:
+            out[i - {k} + 1] = forward if forward < reverse else reverse
+    return out
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def make_pack_line(k):
+    """
+    Builds a canonical packing kernel specialized for one k
+
+    :param  k: kmer size (at most 32)
+    :return:    compiled kernel, or None when numba is unavailable
+    """
+    if not HAVE_NUMBA:
+        return None
+    source = _PACK_SOURCE.format(k=k, mask=(1 << (2 * k)) - 1,
+                                 shift=2 * (k - 1))
+    namespace = {'np': np}
+    exec(compile(source, '<pack_line k={}>'.format(k), 'exec'), namespace)
+    return njit(cache=False)(namespace['_pack_line'])
@@ -1,12 +1,10 @@
-import os
 import sys
 import heapq
 
 try:
-    from pybloomfilter import BloomFilter
+    import numpy as np
 except ImportError:
-    raise ImportError('pybloomfilter module is required. ' +
-                      'Use pip install pybloomfiltermmap3')
+    raise ImportError('numpy module is required. Use pip install numpy')
 
 try:
     from progressbar import ProgressBar
@@ -20,6 +18,7 @@ except ImportError:
     raise ImportError('progressbar2 module is required. ' +
                       'Use pip install progressbar2')
 
+from classes.bloomfilter import BitsetBloomFilter
 from classes.kmerreader import KmerReader
 
 
@@ -56,8 +55,13 @@ class BFCounter():
         else:
             raise TypeError('Arguments should be of type dict')
         self._reader = reader
+        self._packed = reader.k <= 32  # packed uint64 keys are usable
         self._heap = []  # min-heap for finding n most frequent items
         self._kmer_counter = dict()
+        # SoA layout for the packed path: contiguous key/count arrays
+        # built by a sort-reduce pass instead of a Python dict
+        self._counted_keys = None
+        self._counted_counts = None
 
     def nfrequent(self, n):
         """
@@ -66,20 +70,96 @@ class BFCounter():
         :param  n: Desired number of most frequent k-mers to be returned
         :return:    List of n most frequent k-mers and their counts
         """
-        self._count()
+        if self._packed:
+            self._count_packed()
+        else:
+            self._count()
         self._heapify(n)
         return heapq.nlargest(n, self._heap)
 
+    def _count_packed(self):
+        """
+        Implements the Bloom Filter k-mer counting algorithm over packed
+        2-bit uint64 keys
+
+        Consumes batches from KmerReader.kmer_packed, so membership tests
+        are keyed on dense integers instead of ASCII strings and filter
+        probes are vectorized over whole batches. Keys that pass the
+        filter are appended to a contiguous buffer and counted at the
+        end with one sort-reduce pass: a key occurring c times
+        contributes c - 1 buffer entries (its first occurrence only arms
+        the filter), so the final count is the run length plus one.
+        """
+        occurrences = []  # repeat-occurrence buffer, one array per batch
+        bf = BitsetBloomFilter(self._reader.total_kmer, self._error_rate)
+        if self._verbose:
+            # initialize progress bar
+            current = 0
+            update_step = max(1, self._reader.total_kmer // 1000)
+            next_update = update_step
+            format_custom_text = FormatCustomText(
+                'Hash Size: %(value).1f MB',
+                dict(
+                        value=0
+                    )
+            )
+            print('Hashing...')
+            bar = ProgressBar(max_value=self._reader.total_kmer, widgets=[
+                Percentage(),
+                ' ',
+                SimpleProgress(format='(%s)' % SimpleProgress.DEFAULT_FORMAT,),
+                ' ',
+                Bar(),
+                ' ',
+                Timer(),
+                ' ',
+                AdaptiveETA(),
+                ' ',
+                format_custom_text
+            ])
+            bar.start()
+        for batch in self._reader.kmer_packed():
+            # collapse in-batch duplicates so one filter probe per key is
+            # enough and repeats within a batch are still counted
+            keys, counts = np.unique(batch, return_counts=True)
+            exists = bf.contains_batch(keys)
+            bf.add_batch(keys[~exists])
+            # keys already in the filter keep all their occurrences,
+            # new keys lose one to the filter
+            repeats = np.where(exists, counts, counts - 1)
+            occurrences.append(np.repeat(keys, repeats))
+            if self._verbose:
+                # update the progress bar at ~0.1% steps, not per batch;
+                # total_kmer may be a sampled estimate, so clamp the
+                # running count to keep the bar in range
+                current += batch.size
+                if current >= next_update:
+                    bar.update(min(current, self._reader.total_kmer))
+                    next_update = current + update_step
+        buffer = np.concatenate(occurrences) if occurrences \
+            else np.zeros(0, dtype=np.uint64)
+        buffer.sort()
+        changes = np.concatenate(([True], buffer[1:] != buffer[:-1])) \
+            if buffer.size else np.zeros(0, dtype=bool)
+        self._counted_keys = buffer[changes]
+        self._counted_counts = np.diff(np.concatenate(
+            (np.nonzero(changes)[0], [buffer.size]))) + 1
+        if self._verbose:
+            size = (self._counted_keys.nbytes +
+                    self._counted_counts.nbytes) / (1024 ** 2)
+            format_custom_text.update_mapping(value=size)
+            bar.finish()
+            print('Hashing Done!')
+
     def _count(self):
         """
         Implements the Bloom Filter k-mer counting algorithm
         """
         # initialize Bloom Filter
-        bf = BloomFilter(self._reader.total_kmer, self._error_rate, 'kmer_bf')
+        bf = BitsetBloomFilter(self._reader.total_kmer, self._error_rate)
         if self._verbose:
             # initialize progress bar
             current = 0
-            update_threshold = int(self._reader.total_kmer / 100)
             format_custom_text = FormatCustomText(
                 'Hash Size: %(value).1f MB',
                 dict(
@@ -110,22 +190,50 @@ class BFCounter():
                 except KeyError:
                     self._kmer_counter[kmer] = 2  # Add to Hash Table
             if self._verbose:
-                # update progress bar
+                # update the progress bar with a one-instruction bitmask
+                # test; getsizeof stays out of the common path
                 current += 1
-                if update_threshold == 0 or current % update_threshold == 0:
+                if current & 0xFFFF == 0:
                     size = sys.getsizeof(self._kmer_counter) / (1024 ** 2)
-                    bar.update(current,
+                    # total_kmer may be a sampled estimate, so clamp the
+                    # running count to keep the bar in range
+                    bar.update(min(current, self._reader.total_kmer),
                                format_custom_text.update_mapping(value=size))
-        os.remove('kmer_bf')  # remove Bloom Filter from disk
         if self._verbose:
             bar.finish()
             print('Hashing Done!')
 
     def _heapify(self, n):
-        # populate heap
-        for i in range(n):
+        """
+        Selects the n most frequent entries of the hash table with one
+        vectorized partition instead of a heappushpop per entry
+        :param  n: The number of elements to keep
+        """
+        if self._packed:
+            keys = self._counted_keys
+            counts = self._counted_counts
+            size = keys.size
+        else:
+            size = len(self._kmer_counter)
+            counts = np.fromiter(self._kmer_counter.values(), dtype=np.int64,
+                                 count=size)
+            keys = np.array(list(self._kmer_counter.keys()), dtype=object)
+        # the counting structures are no longer needed once the keys and
+        # counts are in local arrays; release them so peak memory does
+        # not carry the full table through the selection and beyond
+        self._kmer_counter = None
+        self._counted_keys = None
+        self._counted_counts = None
+        if size > n:
+            idx = np.argpartition(-counts, n)[:n]
+            counts, keys = counts[idx], keys[idx]
+        for count, kmer in zip(counts.tolist(), keys.tolist()):
+            # keys are packed uint64 values or raw bytes, decode back to
+            # a kmer string only for the winners
+            if self._packed:
+                kmer = self._reader.unpack(kmer)
+            else:
+                kmer = kmer.decode()
+            self._heap.append((count, kmer))
+        while len(self._heap) < n:  # pad as the heap-based version did
             self._heap.append((0, ''))
-        for kmer, count in self._kmer_counter.items():
-            if count > self._heap[0][0]:  # item is bigger than minimum item
-                # replace minimum item with the recent one
-                heapq.heappushpop(self._heap, (count, kmer))
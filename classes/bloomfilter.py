@@ -0,0 +1,101 @@
+import math
+
+try:
+    import mmh3
+except ImportError:
+    raise ImportError('mmh3 module is required. Use pip install mmh3')
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('numpy module is required. Use pip install numpy')
+
+from classes.hashing import splitmix64
+
+
+class BitsetBloomFilter():
+    """
+    An in-process Bloom filter backed by a NumPy byte array.
+
+    The filter is sized from the requested capacity and error rate with
+    the usual m = -n*ln(p)/ln(2)^2 formula and probed with
+    Kirsch-Mitzenmacher double hashing, so only two hash values are
+    computed per key. Batches of packed uint64 kmer keys are probed with
+    vectorized NumPy bit operations; single bytes keys are hashed with
+    mmh3. Unlike an mmap-backed filter there is no file to create or
+    remove.
+    """
+    def __init__(self, capacity, error_rate):
+        """
+        :param  capacity: expected number of distinct keys
+        :param  error_rate: desired false positive probability
+        """
+        capacity = max(1, int(capacity))
+        m = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self._m = max(8, int(m))  # number of bits
+        self._num_hashes = max(1, round(self._m / capacity * math.log(2)))
+        self._bits = np.zeros((self._m + 7) // 8, dtype=np.uint8)
+
+    def __contains__(self, key):
+        """
+        Tests a single bytes key for membership
+        :param  key: kmer as bytes
+        """
+        h1, h2 = self._scalar_hashes(key)
+        for i in range(self._num_hashes):
+            idx = (h1 + i * h2) % self._m
+            if not (self._bits[idx >> 3] >> (idx & 7)) & 1:
+                return False
+        return True
+
+    def add(self, key):
+        """
+        Adds a single bytes key to the filter
+        :param  key: kmer as bytes
+        """
+        h1, h2 = self._scalar_hashes(key)
+        for i in range(self._num_hashes):
+            idx = (h1 + i * h2) % self._m
+            self._bits[idx >> 3] |= 1 << (idx & 7)
+
+    def contains_batch(self, keys):
+        """
+        Tests a batch of packed uint64 keys for membership
+        :param  keys: uint64 array of packed kmers
+        :return:    boolean array, True where all probed bits are set
+        """
+        idx = self._batch_indices(keys)
+        probed = (self._bits[(idx >> np.uint64(3)).astype(np.int64)] >>
+                  (idx & np.uint64(7)).astype(np.uint8)) & 1
+        return np.all(probed.astype(bool), axis=0)
+
+    def add_batch(self, keys):
+        """
+        Adds a batch of packed uint64 keys to the filter
+        :param  keys: uint64 array of packed kmers
+        """
+        if keys.size == 0:
+            return
+        idx = self._batch_indices(keys).ravel()
+        byte = (idx >> np.uint64(3)).astype(np.int64)
+        bit = (np.uint64(1) << (idx & np.uint64(7))).astype(np.uint8)
+        np.bitwise_or.at(self._bits, byte, bit)
+
+    def _batch_indices(self, keys):
+        """
+        Computes the probed bit index matrix for a batch of uint64 keys
+        :param  keys: uint64 array of packed kmers
+        """
+        h1 = splitmix64(keys)
+        h2 = splitmix64(keys, seed=0xD1B54A32D192ED03) | np.uint64(1)
+        i = np.arange(self._num_hashes, dtype=np.uint64).reshape(-1, 1)
+        return (h1 + i * h2) % np.uint64(self._m)
+
+    def _scalar_hashes(self, key):
+        """
+        Computes the double-hashing pair for a single bytes key
+        :param  key: kmer as bytes
+        """
+        h1, h2 = mmh3.hash64(key)
+        mask = (1 << 64) - 1
+        return h1 & mask, (h2 & mask) | 1
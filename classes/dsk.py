@@ -1,27 +1,89 @@
 import math
-import heapq
+import mmap
+import multiprocessing
 import os
 import sys
 
 try:
-    from pybloomfilter import BloomFilter
+    import numpy as np
 except ImportError:
-    raise ImportError('pybloomfilter module is required. ' +
-                      'Use pip install pybloomfiltermmap3')
+    raise ImportError('numpy module is required. Use pip install numpy')
 
-try:
-    import mmh3
-except ImportError:
-    raise ImportError('mmh3 module is required. Use pip install mmh3')
+from classes._dsk_kernels import window_min
+from classes.bloomfilter import BitsetBloomFilter
+from classes.hashing import nthash
+from classes.kmerreader import KmerReader
 
-try:
-    from progressbar import ProgressBar
-    from progressbar import UnknownLength
-except ImportError:
-    raise ImportError('progressbar2 module is required. ' +
-                      'Use pip install progressbar2')
 
-from classes.kmerreader import KmerReader
+# per-partition buffer size at which a worker spills to disk; keeps
+# worker memory bounded instead of holding a whole iteration's routed
+# bytes until the parent gathers them
+_SPILL_BYTES = 1 << 20
+
+
+def _partition_worker(args):
+    """
+    Routes the super-mers of one FASTQ chunk to partition buffers
+
+    Runs in a worker process: maps the chunk read-only, hashes the
+    canonical minimizer of every kmer and groups maximal runs of
+    consecutive kmers routed to the same partition into super-mers, so
+    the overlapping bases of a run are written once instead of once per
+    kmer. A partition buffer that grows past the spill threshold is
+    flushed to a per-(worker, partition) spill file, so only the tails
+    travel back to the parent.
+
+    :param  args: (file_name, start, end, k, m, niter, npart, iter_no,
+                   widx)
+    :return:    list with one bytes object of super-mer tails per
+                partition
+    """
+    file_name, start, end, k, m, niter, npart, iter_no, widx = args
+    width = k - m + 1  # minimizer candidates per kmer
+    out = [bytearray() for j in range(npart)]
+    fds = [-1 for j in range(npart)]  # spill files, opened lazily
+    with open(file_name, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    pos = start
+    line_num = 0  # chunks start at record boundaries
+    while pos < end:
+        newline = mm.find(b'\n', pos)
+        if newline == -1:  # last line without a new line
+            newline = len(mm)
+        if line_num % 4 == 1:  # dna sequence
+            buf = np.frombuffer(view[pos:newline], dtype=np.uint8)
+            if buf.size >= k:
+                # per-kmer minimizer hash; canonical ntHash makes the
+                # routing identical for both strands of a kmer
+                minh = window_min(nthash(buf, m), width)
+                parts = ((minh // np.uint64(niter)) %
+                         np.uint64(npart)).astype(np.int64)
+                # -1 marks kmers that belong to other iterations
+                route = np.where(minh % np.uint64(niter) == iter_no,
+                                 parts, -1)
+                bounds = np.concatenate(
+                    ([0], np.flatnonzero(np.diff(route)) + 1, [route.size]))
+                for s, e in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                    j = int(route[s])
+                    if j >= 0:
+                        # bases of kmers s..e-1 written as one super-mer
+                        out[j] += mm[pos + s:pos + e + k - 1]
+                        out[j] += b'\n'
+                        if len(out[j]) >= _SPILL_BYTES:
+                            if fds[j] == -1:
+                                flags = (os.O_WRONLY | os.O_CREAT |
+                                         os.O_TRUNC)
+                                fds[j] = os.open(
+                                    '{}.{}'.format(j, widx), flags, 0o644)
+                            os.write(fds[j], out[j])
+                            out[j].clear()
+        pos = newline + 1
+        line_num += 1
+    for fd in fds:
+        if fd != -1:
+            os.close(fd)
+    return [bytes(buffer) for buffer in out]
 
 
 class DSK():
@@ -76,6 +138,7 @@ class DSK():
         self._niter = math.ceil(v * b_disk / D)
         self._np = math.ceil((v * b) / (0.7 * self._niter * M))
         self._capacity = v / (self._niter * self._np)
+        self._m = min(self._reader.k, 10)  # minimizer length
         self._heap = []
         self._efficient = 0.7 * M < b * v
 
@@ -98,7 +161,12 @@ class DSK():
             # Print number of iterations and partitions
             print('# of iterations:{}\t# of partitions: {}'.format(self._niter,
                                                                    self._np))
-        self._populate(n)
+        self._n = n
+        if self._reader.k <= 32:
+            self._top_keys = np.zeros(0, dtype=np.uint64)
+        else:
+            self._top_keys = np.zeros(0, dtype=object)
+        self._top_counts = np.zeros(0, dtype=np.int64)
         for i in range(self._niter):
             if self._verbose:
                 print('Iteration #{}'.format(i + 1))
@@ -106,92 +174,157 @@ class DSK():
             self._read_files_and_count()  # count files
             if self._verbose:
                 print('Iteration #{} has been completed'.format(i + 1))
-        return heapq.nlargest(n, self._heap)
+        for count, key in zip(self._top_counts.tolist(),
+                              self._top_keys.tolist()):
+            # decode only the winners back to kmer strings
+            if self._reader.k <= 32:
+                key = self._reader.unpack(key)
+            else:
+                key = key.decode()
+            self._heap.append((count, key))
+        while len(self._heap) < n:  # pad as the heap-based version did
+            self._heap.append((0, ''))
+        self._heap.sort(reverse=True)  # only the n winners, sorted once
+        return self._heap[:n]
 
     def _write_files_for_iteration(self, iter_no):
         """
         Performs one iteration of the DSK algorithm
 
+        The FASTQ is split into record-aligned chunks which are routed
+        to super-mers in parallel worker processes; the parent then
+        writes each partition file sequentially. Since a super-mer
+        carries a whole run of overlapping kmers, the written volume
+        shrinks by roughly a factor of k compared to one record per
+        kmer.
+
         :param  iter_no: Index of the iteration to be performed
         """
+        workers = os.cpu_count() or 1
+        chunks = self._reader.chunk_bounds(workers)
+        tasks = [(self._reader.file_name, start, end, self._reader.k,
+                  self._m, self._niter, self._np, iter_no, widx)
+                 for widx, (start, end) in enumerate(chunks)]
+        self._nworkers = len(tasks)  # spill files to look for later
         if self._verbose:
-            # initialize progress bar
-            print('Writing to files...')
-            bar = ProgressBar(max_value=UnknownLength)
-            bar.start()
-            count = 0
-        files = self._create_files()  # create files for this iteration
-        for kmer in self._reader.kmer():
-            h = mmh3.hash(kmer)  # hash the k-mer
-            if h % self._niter == iter_no:  # belongs to this iteration
-                j = int((h / self._niter) % self._np)  # determine partition
-                files[j].write(kmer + '\n')  # write to file
-                if self._verbose:
-                    # update progress bar
-                    count += 1
-                    bar.update(count)
-        for f in files:
-            f.close()
+            print('Writing to files with {} workers...'.format(len(tasks)))
+        if len(tasks) > 1:
+            with multiprocessing.Pool(len(tasks)) as pool:
+                results = pool.map(_partition_worker, tasks)
+        else:  # no point in forking for a single chunk
+            results = [_partition_worker(tasks[0])]
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        for j in range(self._np):
+            fd = os.open(str(j), flags, 0o644)
+            buffers = [result[j] for result in results if result[j]]
+            if buffers:  # gather the worker tails in one syscall
+                os.writev(fd, buffers)
+            os.close(fd)
         if self._verbose:
-            bar.finish()
             print('Writing to files has been completed')
 
-    def _create_files(self):
-        """
-        Creates files for each partition for a specific iteration
-        """
-        return [open('{}'.format(j), 'w') for j in range(self._np)]
-
     def _read_files_and_count(self):
         if self._verbose:
             print('Reading from files...')
         for j in range(self._np):
             if self._verbose:
-                # initialize progress bar
                 print('Partition #{}'.format(j + 1))
-                bar = ProgressBar(max_value=UnknownLength)
-                bar.start()
-                count = 0
-            bf = BloomFilter(
-                self._capacity,
-                self._error_rate,
-                'kmer_bf'
-            )
-            kmer_counter = dict()
-            with open(str(j), 'r') as f:  # open file for the current partition
-                for kmer in f:
-                    if kmer not in bf:  # not in Bloom Filter
-                        bf.add(kmer)
-                    else:  # in Bloom Filter
-                        try:
-                            kmer_counter[kmer] += 1  # in Hash Table
-                        except KeyError:  # not in Hash Table
-                            kmer_counter[kmer] = 2  # Add to Hash Table
-                    if self._verbose:
-                        # update progress bar
-                        count += 1
-                        bar.update(count)
+            # a partition is its workers' spill files plus the tail file
+            # written by the parent
+            names = ['{}.{}'.format(j, w) for w in range(self._nworkers)]
+            names = [name for name in names if os.path.isfile(name)]
+            names.append(str(j))
+            pieces = []
+            for name in names:
+                with open(name, 'rb') as f:
+                    pieces.append(f.read())
+            data = b''.join(pieces) if len(pieces) > 1 else pieces[0]
+            del pieces
             if self._verbose:
-                bar.finish()
-                print('Populating the heap...')
-            for kmer, count in kmer_counter.items():
-                if count > self._heap[0][0]:  # item is bigger than minimum
-                    # replace minimum item with the recent one
-                    # kmer.rstrip() is used to eliminate the new line
-                    heapq.heappushpop(self._heap, (count, kmer.rstrip()))
+                print('Merging the top counts...')
+            if self._reader.k <= 32:
+                unique, counts = self._count_partition_packed(data)
+                table_size = unique.nbytes + counts.nbytes
+            else:
+                kmer_counter = self._count_partition_lines(data)
+                unique = np.array(list(kmer_counter.keys()), dtype=object)
+                counts = np.fromiter(kmer_counter.values(), dtype=np.int64,
+                                     count=len(kmer_counter))
+                table_size = sys.getsizeof(kmer_counter)
+            self._merge_top(unique, counts)
             if self._verbose:
-                print('Heap is populated')
+                print('Top counts are merged')
                 print(('Partition #{} has been completed with {:.1f} MB hash '
-                       + 'table').format(
-                       j + 1,
-                       sys.getsizeof(kmer_counter) / (1024 ** 2)))
-            os.remove(str(j))  # remove the partition file
-            os.remove('kmer_bf')
+                       + 'table').format(j + 1, table_size / (1024 ** 2)))
+            for name in names:  # remove the partition files
+                os.remove(name)
 
-    def _populate(self, n):
+    def _merge_top(self, unique, counts):
         """
-        Populates min-heap
-        :param  n: The number of elements the heap will have
+        Merges one partition's (unique, counts) arrays into the running
+        top-n selection with a single vectorized partition
+        :param  unique: unique kmer keys of the partition
+        :param  counts: counts matching the unique keys
         """
-        for i in range(n):
-            self._heap.append((0, ''))
+        all_keys = np.concatenate((self._top_keys, unique))
+        all_counts = np.concatenate((self._top_counts, counts))
+        if all_counts.size > self._n:
+            idx = np.argpartition(-all_counts, self._n)[:self._n]
+            all_keys, all_counts = all_keys[idx], all_counts[idx]
+        self._top_keys, self._top_counts = all_keys, all_counts
+
+    def _count_partition_packed(self, data):
+        """
+        Counts one partition file by sorting and run-length encoding
+
+        The file holds one super-mer per line; every super-mer is
+        expanded back into its packed kmers with one vectorized pass.
+        The whole partition fits in memory by construction, so sorting
+        the keys and reducing equal runs replaces both the Bloom filter
+        and the hash table for this stage.
+
+        :param  data: raw content of a partition file
+        :return:    (unique keys, counts) as NumPy arrays
+        """
+        arrays = []
+        lines = data.split(b'\n')
+        if lines and not lines[-1]:  # trailing new line
+            lines.pop()
+        for smer in lines:
+            buf = np.frombuffer(smer, dtype=np.uint8)
+            arrays.append(self._reader.pack_line(buf))
+        if not arrays:  # empty partition
+            empty = np.zeros(0, dtype=np.uint64)
+            return empty, empty.astype(np.int64)
+        keys = np.concatenate(arrays)
+        keys.sort()
+        changes = np.concatenate(([True], keys[1:] != keys[:-1]))
+        unique = keys[changes]
+        counts = np.diff(np.concatenate((np.nonzero(changes)[0],
+                                         [keys.size])))
+        return unique, counts
+
+    def _count_partition_lines(self, data):
+        """
+        Counts one partition file of super-mers (k > 32 fallback)
+        :param  data: raw content of a partition file
+        """
+        bf = BitsetBloomFilter(self._capacity, self._error_rate)
+        kmer_counter = dict()
+        k = self._reader.k
+        lines = data.split(b'\n')
+        if lines and not lines[-1]:  # trailing new line
+            lines.pop()
+        for smer in lines:
+            buf = np.frombuffer(smer, dtype=np.uint8)
+            windows = np.lib.stride_tricks.sliding_window_view(buf, k)
+            for row in windows:
+                kmer = row.tobytes()
+                if kmer not in bf:  # not in Bloom Filter
+                    bf.add(kmer)
+                else:  # in Bloom Filter
+                    try:
+                        kmer_counter[kmer] += 1  # in Hash Table
+                    except KeyError:  # not in Hash Table
+                        kmer_counter[kmer] = 2  # Add to Hash Table
+        return kmer_counter
@@ -0,0 +1,117 @@
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('numpy module is required. Use pip install numpy')
+
+
+def splitmix64(keys, seed=0x9E3779B97F4A7C15):
+    """
+    Vectorized splitmix64 finalizer over a uint64 key array
+
+    A single-round integer mixer that replaces per-kmer mmh3 calls on
+    the packed representation: near-uniform output in a handful of
+    instructions per lane, with no Python/C boundary crossing per kmer.
+
+    :param  keys: uint64 array of packed kmers
+    :param  seed: additive constant applied before mixing
+    """
+    z = keys + np.uint64(seed)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+# ntHash per-base seeds and their complement-strand counterparts
+_NT_SEEDS = {'A': 0x3C8BFBB395C60474, 'C': 0x3193C18562A02B4C,
+             'G': 0x20323ED082572324, 'T': 0x295549F54BE24456}
+_NT_LUT = np.zeros(256, dtype=np.uint64)
+_NT_RC_LUT = np.zeros(256, dtype=np.uint64)
+for _base, _pair in (('A', 'T'), ('C', 'G'), ('G', 'C'), ('T', 'A')):
+    _NT_LUT[ord(_base)] = _NT_SEEDS[_base]
+    _NT_RC_LUT[ord(_base)] = _NT_SEEDS[_pair]
+
+
+def _rotate_left(values, amounts):
+    """
+    Rotates uint64 lanes left by per-lane amounts (0..63)
+    :param  values: uint64 array
+    :param  amounts: uint64 array of rotation amounts
+    """
+    inverse = (np.uint64(64) - amounts) % np.uint64(64)
+    return (values << amounts) | (values >> inverse)
+
+
+def _rotate_right(values, amounts):
+    """
+    Rotates uint64 lanes right by per-lane amounts (0..63)
+    :param  values: uint64 array
+    :param  amounts: uint64 array of rotation amounts
+    """
+    inverse = (np.uint64(64) - amounts) % np.uint64(64)
+    return (values >> amounts) | (values << inverse)
+
+
+def nthash(buf, width):
+    """
+    Computes the canonical ntHash of every window of a sequence line
+
+    ntHash is a rolling hash: the hash of window i+1 reuses the hash of
+    window i, so each base contributes O(1) work instead of O(width).
+    The recurrence unrolls into a closed form -- rotate each base seed
+    by its position, prefix-XOR, difference the window ends and rotate
+    back -- which lets all windows of a line be hashed with a handful
+    of vectorized passes over uint64 lanes. The canonical value is the
+    minimum of the forward and reverse-complement strand hashes, so a
+    window and its reverse complement hash identically.
+
+    :param  buf: uint8 array of base characters
+    :param  width: window length to be hashed
+    :return:    uint64 array with one hash per window
+    """
+    idx = np.arange(buf.size, dtype=np.uint64)
+    rot = idx % np.uint64(64)
+    # forward strand: h(i) = XOR rol(seed(s[i+j]), width-1-j)
+    contrib = _rotate_right(_NT_LUT[buf], rot)
+    prefix = np.bitwise_xor.accumulate(contrib)
+    folded = prefix[width - 1:].copy()
+    folded[1:] ^= prefix[:-width]
+    forward = _rotate_left(
+        folded, (idx[:folded.size] + np.uint64(width - 1)) % np.uint64(64))
+    # reverse-complement strand: h(i) = XOR rol(rcseed(s[i+j]), j)
+    contrib = _rotate_left(_NT_RC_LUT[buf], rot)
+    prefix = np.bitwise_xor.accumulate(contrib)
+    folded = prefix[width - 1:].copy()
+    folded[1:] ^= prefix[:-width]
+    reverse = _rotate_right(folded, idx[:folded.size] % np.uint64(64))
+    return np.minimum(forward, reverse)
+
+
+def reverse_complement(keys, k):
+    """
+    Computes the reverse complement of packed 2-bit uint64 kmers
+
+    Complementing a base is a bitwise NOT of its 2-bit code, so the
+    whole word is inverted and the base order is reversed with SWAR
+    swaps: adjacent 2-bit pairs, then nibbles, then a byte swap. The
+    result is aligned back to the low 2k bits.
+
+    :param  keys: uint64 array of packed kmers
+    :param  k: kmer size (at most 32)
+    """
+    m2 = np.uint64(0x3333333333333333)
+    m4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = ~keys
+    x = ((x >> np.uint64(2)) & m2) | ((x & m2) << np.uint64(2))
+    x = ((x >> np.uint64(4)) & m4) | ((x & m4) << np.uint64(4))
+    x = x.byteswap()
+    return x >> np.uint64(64 - 2 * k)
+
+
+def canonical(keys, k):
+    """
+    Maps packed kmers to the minimum of the kmer and its reverse
+    complement, so a kmer and its complement strand count as one
+    :param  keys: uint64 array of packed kmers
+    :param  k: kmer size (at most 32)
+    """
+    return np.minimum(keys, reverse_complement(keys, k))
@@ -1,9 +1,23 @@
+import mmap
+import os
 import os.path
 
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('numpy module is required. Use pip install numpy')
+
+from classes._specialize import make_pack_line
+from classes.hashing import canonical
+
 
 class KmerReader():
     """
     A file reader class for reading K-mers from FASTQ files.
+
+    The file is memory mapped once and lines are located with
+    mmap.find (memchr underneath), so iteration works on raw bytes
+    without per-line str allocation or Unicode decoding.
     """
     def __init__(self, file_name, kmer_size):
         """
@@ -11,49 +25,240 @@ class KmerReader():
         :param  kmer_size: kmer size to be counted in the file
         """
         if (os.path.isfile(file_name)):
-            self._file = file_name
+            self.file_name = file_name
             self.k = kmer_size
+            # 256-entry LUT mapping base characters to their 2-bit codes
+            self._lut = np.zeros(256, dtype=np.uint8)
+            self._lut[ord('C')] = 1
+            self._lut[ord('G')] = 2
+            self._lut[ord('T')] = 3
+            # digit weights for packing a window into a base-4 integer
+            if (kmer_size <= 32):  # 2 bits per base fit in an uint64
+                self._shift_vec = 4 ** np.arange(
+                    kmer_size - 1, -1, -1, dtype=np.uint64)
+                # kernel with this k baked in, None without numba
+                self._pack_kernel = make_pack_line(kmer_size)
+            if (os.path.getsize(file_name) > 0):
+                fd = os.open(file_name, os.O_RDONLY)
+                try:
+                    self._mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+                finally:
+                    os.close(fd)
+            else:  # cannot mmap an empty file
+                self._mm = None
+            # record start offsets, located lazily and cached since the
+            # file never changes between DSK iterations
+            self._record_starts = None
             self.total_kmer = self._count()
             if (self.total_kmer == 0):  # invalid file
-                raise TypeError(self._file + ' is not a valid FASTQ file.')
+                raise TypeError(file_name + ' is not a valid FASTQ file.')
         else:
             raise FileNotFoundError('File ' + file_name + ' not found!')
 
+    def sequences(self):
+        """
+        Iterates over the sequence lines of the file as zero-copy
+        memoryview slices of the underlying mmap
+        """
+        mm = self._mm
+        view = memoryview(mm)
+        size = len(mm)
+        pos = 0
+        line_num = 0
+        while pos < size:
+            newline = mm.find(b'\n', pos)
+            if (newline == -1):  # last line without a new line
+                newline = size
+            if (line_num % 4 == 1):
+                yield view[pos:newline]
+            pos = newline + 1
+            line_num += 1
+        return None
+
     def kmer(self):
         """
         Iterates over kmers in a file
+
+        Each sequence line is viewed as a NumPy byte buffer and all kmers
+        in the line are produced at once through a zero-copy strided
+        window, instead of slicing one string per position. Kmers are
+        yielded as bytes objects.
+        """
+        for seq in self.sequences():
+            buf = np.frombuffer(seq, dtype=np.uint8)
+            if (len(buf) >= self.k):
+                windows = np.lib.stride_tricks.sliding_window_view(
+                    buf, self.k)
+                for row in windows:
+                    yield row.tobytes()  # yield kmer for use
+        return None
+
+    def kmer_packed(self):
+        """
+        Iterates over kmers in a file, packed into 2-bit uint64 keys
+
+        Each sequence line is mapped to 2-bit base codes through the LUT
+        and every window of k codes is folded into a single uint64, so
+        downstream hashing and counting operate on dense integers instead
+        of ASCII strings. Yields one uint64 array per sequence line.
+        Only available for k <= 32.
         """
-        with open(self._file, 'r') as f:
-            line_num = 0
-            for line in f:
-                if (line_num % 4 == 1):
-                    kmers_in_line = len(line) - self.k  # eliminate new line
-                    for i in range(kmers_in_line):
-                        kmer = line[i:self.k + i]  # yield kmer for use
-                        yield kmer
-                line_num += 1
+        if (self.k > 32):
+            raise ValueError('Packed kmers require k <= 32')
+        for seq in self.sequences():
+            buf = np.frombuffer(seq, dtype=np.uint8)
+            if (len(buf) >= self.k):
+                yield self.pack_line(buf)
         return None
 
+    # bytes examined per block while locating newlines
+    _SCAN_BYTES = 64 * 1024 * 1024
+
+    def _find_record_starts(self):
+        """
+        Locates the byte offset of every FASTQ record start
+
+        Newlines are found in fixed-size blocks, so the temporary
+        boolean mask stays bounded instead of growing with the file.
+        The offsets are computed once and cached on the reader.
+        """
+        if (self._record_starts is not None):
+            return self._record_starts
+        arr = np.frombuffer(self._mm, dtype=np.uint8)
+        found = []
+        for pos in range(0, arr.size, self._SCAN_BYTES):
+            block = arr[pos:pos + self._SCAN_BYTES]
+            found.append(np.flatnonzero(block == ord('\n')) + pos)
+        newlines = np.concatenate(found) if found \
+            else np.zeros(0, dtype=np.int64)
+        line_starts = np.concatenate(([0], newlines + 1))
+        if (line_starts[-1] >= arr.size):  # file ends with a new line
+            line_starts = line_starts[:-1]
+        self._record_starts = line_starts[::4]  # records span 4 lines
+        return self._record_starts
+
+    def chunk_bounds(self, count):
+        """
+        Splits the file into at most count byte ranges aligned to FASTQ
+        record starts, for processing chunks in parallel
+        :param  count: desired number of chunks
+        :return:    list of (start, end) byte offsets
+        """
+        record_starts = self._find_record_starts()
+        starts = []
+        for piece in np.array_split(record_starts, count):
+            if (piece.size > 0):
+                starts.append(int(piece[0]))
+        starts.append(len(self._mm))
+        return list(zip(starts[:-1], starts[1:]))
+
+    def pack(self, windows):
+        """
+        Packs rows of k base characters into canonical 2-bit uint64 keys
+
+        Each kmer is mapped to the minimum of itself and its reverse
+        complement, so both strands of a kmer share one key.
+
+        :param  windows: 2D uint8 array with one kmer per row
+        """
+        keys = (self._lut[windows] * self._shift_vec).sum(
+            axis=1, dtype=np.uint64)
+        return canonical(keys, self.k)
+
+    def pack_line(self, buf):
+        """
+        Packs every kmer of one sequence line into canonical 2-bit
+        uint64 keys
+
+        Dispatches to the kernel specialized for this reader's k when
+        numba is available; otherwise the generic vectorized packing
+        over strided windows is used.
+
+        :param  buf: uint8 array of base characters, at least k long
+        """
+        if (self._pack_kernel is not None):
+            return self._pack_kernel(buf, self._lut)
+        windows = np.lib.stride_tricks.sliding_window_view(buf, self.k)
+        return self.pack(windows)
+
+    def unpack(self, value):
+        """
+        Decodes a packed 2-bit uint64 key back into a kmer string
+        :param  value: packed kmer produced by kmer_packed
+        """
+        bases = []
+        value = int(value)
+        for i in range(self.k):
+            bases.append('ACGT'[value & 3])
+            value >>= 2
+        return ''.join(reversed(bases))
+
+    # sample size for estimating the total kmer count of large files
+    _SAMPLE_BYTES = 1 << 20
+
     def _count(self):
         """
-        Counts the total number of kmers in the file.
+        Estimates the total number of kmers in the file.
+
+        Files up to the sample size are counted exactly. Larger files
+        are validated and measured over the first complete records of
+        the sample and the total is extrapolated from the average
+        record length, which avoids a full extra pass over multi-GB
+        inputs just to size the downstream structures.
+        If the file is not in FASTQ format, returns 0.
+        """
+        if (self._mm is None):  # empty file
+            return 0
+        if (len(self._mm) <= self._SAMPLE_BYTES):
+            return self._count_exact()
+        sample = self._mm[:self._SAMPLE_BYTES]
+        lines = sample[:sample.rfind(b'\n')].split(b'\n')
+        records = len(lines) // 4
+        if (records == 0):  # lines longer than the sample, count exactly
+            return self._count_exact()
+        consumed = 0
+        sequence_bytes = 0
+        for i in range(records):
+            ident, sequence, comment, quality = lines[4 * i:4 * i + 4]
+            if (not ident.startswith(b'@')):  # sample id
+                return 0
+            if (not comment.startswith(b'+')):  # comment
+                return 0
+            sequence_bytes += len(sequence)
+            consumed += (len(ident) + len(sequence) + len(comment) +
+                         len(quality) + 4)  # 4 new line characters
+        average_record = consumed / records
+        average_sequence = sequence_bytes / records
+        estimate = round(len(self._mm) / average_record *
+                         (average_sequence - self.k + 1))
+        return estimate if estimate > 0 else 0
+
+    def _count_exact(self):
+        """
+        Counts the total number of kmers in the file with a full pass.
         If the file is not in FASTQ format, returns 0.
         """
+        mm = self._mm
+        size = len(mm)
         count = 0
-        with open(self._file, 'r') as f:
-            line_num = 0
-            for line in f:
-                if (line_num % 4 == 0):  # sample id
-                    if (not line.startswith('@')):
-                        count = 0
-                        break
-                elif (line_num % 4 == 1):  # dna sequence
-                    count += len(line) - self.k  # eliminate new line char
-                elif (line_num % 4 == 2):  # comment
-                    if (not line.startswith('+')):
-                        count = 0
-                        break
-                else:  # quality (do nothing)
-                    pass
-                line_num += 1
+        pos = 0
+        line_num = 0
+        while pos < size:
+            newline = mm.find(b'\n', pos)
+            if (newline == -1):  # last line without a new line
+                newline = size
+            if (line_num % 4 == 0):  # sample id
+                if (mm[pos:pos + 1] != b'@'):
+                    count = 0
+                    break
+            elif (line_num % 4 == 1):  # dna sequence
+                count += newline - pos + 1 - self.k  # line and new line
+            elif (line_num % 4 == 2):  # comment
+                if (mm[pos:pos + 1] != b'+'):
+                    count = 0
+                    break
+            else:  # quality (do nothing)
+                pass
+            pos = newline + 1
+            line_num += 1
         return count
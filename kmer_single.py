@@ -1,22 +1,462 @@
 import argparse
 from collections import defaultdict
+from concurrent import futures
 import heapq
 import math
+import mmap
 import os
 import sys
 import time
 
 
 try:
-    from pybloomfilter import BloomFilter
+    import mmh3
 except ImportError:
-    raise ImportError('pybloomfilter module is required. ' +
-                      'Use pip install pybloomfiltermmap3')
+    raise ImportError('mmh3 module is required. Use pip install mmh3')
 
 try:
-    import mmh3
+    import numpy as np
 except ImportError:
-    raise ImportError('mmh3 module is required. Use pip install mmh3')
+    raise ImportError('numpy module is required. Use pip install numpy')
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:  # numba is optional, the numpy fallback is used
+    HAVE_NUMBA = False
+
+
+# reads stacked per batch scan in bf_counter
+BATCH_READS = 256
+
+# bytes examined per block while locating newlines
+SCAN_BLOCK = 64 * 1024 * 1024
+
+# 256-entry LUT mapping base characters to their 2-bit codes
+ENC = np.zeros(256, dtype=np.uint8)
+ENC[ord('C')] = 1
+ENC[ord('G')] = 2
+ENC[ord('T')] = 3
+
+
+def encode_seq(line):
+    """
+    Encodes a sequence line into an array of 2-bit base codes
+    :param  line: DNA sequence line with a trailing new line
+    """
+    buf = np.frombuffer(line.rstrip('\n').encode('ascii'), dtype=np.uint8)
+    return ENC[buf]
+
+
+def newline_ends(arr):
+    """
+    Locates the end offset of every line in a mapped file
+
+    Scans fixed-size blocks, so the temporary boolean newline mask
+    stays bounded instead of growing with the file. The file end is
+    appended when the last line has no trailing new line.
+
+    :param  arr: uint8 view of the whole file
+    :return:    array of line end offsets
+    """
+    newline = ord('\n')
+    found = []
+    for pos in range(0, arr.size, SCAN_BLOCK):
+        block = arr[pos:pos + SCAN_BLOCK]
+        found.append(np.flatnonzero(block == newline) + pos)
+    ends = np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+    if arr.size and arr[-1] != newline:  # last line without a new line
+        ends = np.concatenate((ends, [arr.size]))
+    return ends
+
+
+def scan_kmers_numpy(seq, k):
+    """
+    Packs every kmer of an encoded sequence into 2-bit uint64 keys with
+    one vectorized pass over strided windows
+    :param  seq: uint8 array of 2-bit base codes
+    :param  k: K-mer size (at most 32)
+    :return:    uint64 array with one packed key per kmer
+    """
+    shift_vec = 4 ** np.arange(k - 1, -1, -1, dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(seq, k)
+    return (windows * shift_vec).sum(axis=1, dtype=np.uint64)
+
+
+# compiled scanner per k; closures bake the constants into the JIT
+_SCANNER_CACHE = {}
+
+
+def make_scanner(k):
+    """
+    Builds a kmer scanner specialized for one k
+
+    k is fixed for a whole run, so the closure is JIT compiled with k
+    and the 2-bit mask as compile-time constants, letting the backend
+    fold the mask and loop bounds instead of threading them through as
+    runtime values. Compiled variants are cached per k; without numba
+    the generic numpy scan is bound instead.
+
+    :param  k: K-mer size (at most 32)
+    :return:    function mapping a 2-bit code array to packed keys
+    """
+    if k in _SCANNER_CACHE:
+        return _SCANNER_CACHE[k]
+    if HAVE_NUMBA:
+        mask = np.uint64((1 << (2 * k)) - 1)
+
+        @njit
+        def scanner(seq):
+            # rolling 2-bit encoder: each base contributes O(1) work
+            out = np.empty(seq.size - k + 1, dtype=np.uint64)
+            h = np.uint64(0)
+            for i in range(seq.size):
+                h = ((h << np.uint64(2)) | np.uint64(seq[i])) & mask
+                if i >= k - 1:
+                    out[i - k + 1] = h
+            return out
+    else:
+        def scanner(seq):
+            return scan_kmers_numpy(seq, k)
+    _SCANNER_CACHE[k] = scanner
+    return scanner
+
+
+def splitmix64(keys, seed=0x9E3779B97F4A7C15):
+    """
+    Vectorized splitmix64 finalizer over a uint64 key array
+    :param  keys: uint64 array of packed kmers
+    :param  seed: additive constant applied before mixing
+    """
+    z = keys + np.uint64(seed)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def bloom_init(capacity, error_rate):
+    """
+    Sizes an in-memory Bloom filter as a numpy byte array, using
+    m = -n * ln(p) / ln(2)^2 bits and the matching optimal hash count
+    :param  capacity: expected number of distinct keys
+    :param  error_rate: desired false positive probability
+    :return:    (bit array, number of bits, number of hashes)
+    """
+    capacity = max(1, int(capacity))
+    m = max(64, int(math.ceil(-capacity * math.log(error_rate) /
+                              (math.log(2) ** 2))))
+    num_hashes = max(1, int(round((m / capacity) * math.log(2))))
+    bits = np.zeros((m + 7) // 8, dtype=np.uint8)
+    return bits, m, num_hashes
+
+
+def bloom_indices(keys, m, num_hashes):
+    """
+    Derives all probe positions of a key batch from two mixes with the
+    Kirsch-Mitzenmacher scheme g_i = (h1 + i * h2) mod m
+    :param  keys: uint64 array of packed kmers
+    :param  m: number of bits in the filter
+    :param  num_hashes: number of probe positions per key
+    """
+    h1 = splitmix64(keys)
+    h2 = splitmix64(keys, seed=0xD1B54A32D192ED03) | np.uint64(1)
+    steps = np.arange(num_hashes, dtype=np.uint64)[:, np.newaxis]
+    return (h1 + steps * h2) % np.uint64(m)
+
+
+def bloom_test_set(bits, m, num_hashes, key):
+    """
+    Tests one string key and inserts it in the same pass
+
+    The two 64-bit halves of a single mmh3 call drive the
+    Kirsch-Mitzenmacher probe sequence, so membership and insertion
+    share one hash computation with no per-call file-backed state.
+
+    :param  bits: filter byte array
+    :param  m: number of bits in the filter
+    :param  num_hashes: number of probe positions per key
+    :param  key: kmer string
+    :return:    True if every probed bit was already set
+    """
+    # mask the signed halves manually, mmh3 2.4 has no signed kwarg
+    h1, h2 = mmh3.hash64(key)
+    mask = (1 << 64) - 1
+    h1 &= mask
+    h2 = (h2 & mask) | 1
+    present = True
+    for i in range(num_hashes):
+        pos = (h1 + i * h2) % m
+        flag = 1 << (pos & 7)
+        if not bits[pos >> 3] & flag:
+            present = False
+            bits[pos >> 3] |= flag
+    return present
+
+
+def bloom_contains(bits, m, num_hashes, keys):
+    """
+    Tests a whole key batch for membership in one vectorized pass
+    :param  bits: filter byte array
+    :param  m: number of bits in the filter
+    :param  num_hashes: number of probe positions per key
+    :param  keys: uint64 array of packed kmers
+    :return:    boolean array, True where all probed bits are set
+    """
+    idx = bloom_indices(keys, m, num_hashes)
+    probes = (bits[(idx >> np.uint64(3)).astype(np.int64)] >>
+              (idx & np.uint64(7)).astype(np.uint8)) & np.uint8(1)
+    return probes.all(axis=0)
+
+
+def bloom_add(bits, m, num_hashes, keys):
+    """
+    Inserts a whole key batch in one vectorized pass
+    :param  bits: filter byte array
+    :param  m: number of bits in the filter
+    :param  num_hashes: number of probe positions per key
+    :param  keys: uint64 array of packed kmers
+    """
+    idx = bloom_indices(keys, m, num_hashes)
+    np.bitwise_or.at(
+        bits, (idx >> np.uint64(3)).astype(np.int64).ravel(),
+        np.uint8(1) << (idx & np.uint64(7)).astype(np.uint8).ravel())
+
+
+# compiled batch scanner per k, analogous to _SCANNER_CACHE
+_BATCH_SCANNER_CACHE = {}
+
+
+def make_batch_scanner(k):
+    """
+    Builds a scanner specialized for one k over a batch of equal-length
+    reads
+
+    Illumina reads in a file typically share one length, so a batch
+    stacks into a (reads, length) matrix and the rolling recurrence
+    runs row-parallel: numba distributes the outer row loop and the
+    regular inner loop vectorizes across it. Without numba a strided
+    window fold over the batch axis is bound instead.
+
+    :param  k: K-mer size (at most 32)
+    :return:    function mapping a 2-bit code matrix to packed keys
+    """
+    if k in _BATCH_SCANNER_CACHE:
+        return _BATCH_SCANNER_CACHE[k]
+    if HAVE_NUMBA:
+        mask = np.uint64((1 << (2 * k)) - 1)
+
+        @njit(parallel=True)
+        def batch_scanner(mat):
+            reads, length = mat.shape
+            out = np.empty((reads, length - k + 1), dtype=np.uint64)
+            for r in prange(reads):
+                h = np.uint64(0)
+                for i in range(length):
+                    h = ((h << np.uint64(2)) |
+                         np.uint64(mat[r, i])) & mask
+                    if i >= k - 1:
+                        out[r, i - k + 1] = h
+            return out
+    else:
+        shift_vec = 4 ** np.arange(k - 1, -1, -1, dtype=np.uint64)
+
+        def batch_scanner(mat):
+            windows = np.lib.stride_tricks.sliding_window_view(
+                mat, k, axis=1)
+            return (windows * shift_vec).sum(axis=2, dtype=np.uint64)
+    _BATCH_SCANNER_CACHE[k] = batch_scanner
+    return batch_scanner
+
+
+# compiled key-and-hash scanner per k for the dsk write phase
+_ROUTE_SCANNER_CACHE = {}
+
+
+def make_route_scanner(k):
+    """
+    Builds a scanner specialized for one k that emits the packed key
+    and the routing ntHash of every kmer in a single pass
+
+    The rolling form updates the hash in O(1) per base: rotate the
+    running value, XOR in the seed of the entering base and XOR out the
+    seed of the leaving base pre-rotated by k. With numba both outputs
+    come from one compiled loop; without it the closed-form nthash and
+    the numpy scan are combined instead.
+
+    :param  k: K-mer size (at most 32)
+    :return:    function mapping a 2-bit code array to (keys, hashes)
+    """
+    if k in _ROUTE_SCANNER_CACHE:
+        return _ROUTE_SCANNER_CACHE[k]
+    if HAVE_NUMBA:
+        mask = np.uint64((1 << (2 * k)) - 1)
+        # seeds of the leaving base, already rotated k positions
+        rot = k % 64
+        rotk = (NTH << np.uint64(rot)) | (NTH >> np.uint64((64 - rot) % 64))
+        seeds = NTH
+
+        @njit
+        def route_scanner(seq):
+            count = seq.size - k + 1
+            keys = np.empty(count, dtype=np.uint64)
+            hashes = np.empty(count, dtype=np.uint64)
+            key = np.uint64(0)
+            h = np.uint64(0)
+            for i in range(seq.size):
+                c = seq[i]
+                h = ((h << np.uint64(1)) |
+                     (h >> np.uint64(63))) ^ seeds[c]
+                key = ((key << np.uint64(2)) | np.uint64(c)) & mask
+                if i >= k:  # drop the base that left the window
+                    h ^= rotk[seq[i - k]]
+                if i >= k - 1:
+                    keys[i - k + 1] = key
+                    hashes[i - k + 1] = h
+            return keys, hashes
+    else:
+        def route_scanner(seq):
+            return scan_kmers_numpy(seq, k), nthash(seq, k)
+    _ROUTE_SCANNER_CACHE[k] = route_scanner
+    return route_scanner
+
+
+if HAVE_NUMBA:
+    @njit
+    def table_update(table_keys, table_counts, keys):
+        """
+        Counts a key batch into an open-addressing hash table
+
+        One mixed probe lands on the key's slot or starts a linear scan;
+        a slot with count zero is empty, so first-seen detection and
+        counting collapse into a single cache-line lookup.
+
+        :param  table_keys: uint64 slot keys (power-of-two size)
+        :param  table_counts: uint32 slot counts, zero marks empty
+        :param  keys: uint64 array of packed kmers
+        :return:    number of newly occupied slots
+        """
+        mask = np.uint64(table_keys.size - 1)
+        filled = 0
+        for i in range(keys.size):
+            key = keys[i]
+            # inline splitmix64 so probing stays in compiled code
+            z = key + np.uint64(0x9E3779B97F4A7C15)
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            slot = (z ^ (z >> np.uint64(31))) & mask
+            while True:
+                if table_counts[slot] == 0:  # first sighting
+                    table_keys[slot] = key
+                    table_counts[slot] = 1
+                    filled += 1
+                    break
+                if table_keys[slot] == key:
+                    table_counts[slot] += 1
+                    break
+                slot = (slot + np.uint64(1)) & mask
+        return filled
+
+    @njit
+    def table_rehash(table_keys, table_counts, new_keys, new_counts):
+        """
+        Re-inserts every occupied slot into a larger table
+        :param  table_keys: current uint64 slot keys
+        :param  table_counts: current uint32 slot counts
+        :param  new_keys: uint64 slot keys of the larger table
+        :param  new_counts: uint32 slot counts of the larger table
+        """
+        mask = np.uint64(new_keys.size - 1)
+        for s in range(table_keys.size):
+            count = table_counts[s]
+            if count != 0:
+                key = table_keys[s]
+                z = key + np.uint64(0x9E3779B97F4A7C15)
+                z = (z ^ (z >> np.uint64(30))) * \
+                    np.uint64(0xBF58476D1CE4E5B9)
+                z = (z ^ (z >> np.uint64(27))) * \
+                    np.uint64(0x94D049BB133111EB)
+                slot = (z ^ (z >> np.uint64(31))) & mask
+                while new_counts[slot] != 0:
+                    slot = (slot + np.uint64(1)) & mask
+                new_keys[slot] = key
+                new_counts[slot] = count
+
+
+def table_init(capacity):
+    """
+    Allocates an open-addressing table sized to a power of two with
+    room to stay below ~0.7 load at the expected key count
+    :param  capacity: expected number of distinct keys
+    :return:    (slot key array, slot count array)
+    """
+    size = 64
+    while size < int(capacity) * 13 // 10:
+        size <<= 1
+    return (np.zeros(size, dtype=np.uint64),
+            np.zeros(size, dtype=np.uint32))
+
+
+# ntHash per-base seeds, indexed by 2-bit base code (A, C, G, T)
+NTH = np.array([0x3C8BFBB395C60474, 0x3193C18562A02B4C,
+                0x20323ED082572324, 0x295549F54BE24456], dtype=np.uint64)
+
+
+def rotl64(values, amounts):
+    """
+    Rotates uint64 lanes left by per-lane amounts (0..63)
+    :param  values: uint64 array
+    :param  amounts: uint64 array of rotation amounts
+    """
+    inverse = (np.uint64(64) - amounts) % np.uint64(64)
+    return (values << amounts) | (values >> inverse)
+
+
+def rotr64(values, amounts):
+    """
+    Rotates uint64 lanes right by per-lane amounts (0..63)
+    :param  values: uint64 array
+    :param  amounts: uint64 array of rotation amounts
+    """
+    inverse = (np.uint64(64) - amounts) % np.uint64(64)
+    return (values >> amounts) | (values << inverse)
+
+
+def nthash(seq, k):
+    """
+    Computes the ntHash of every kmer of an encoded sequence
+
+    ntHash is a rolling hash, so consecutive kmers share all but one
+    base of work. The recurrence unrolls into a closed form -- rotate
+    each base seed by its position, prefix-XOR, difference the window
+    ends and rotate back -- which hashes all kmers of a line with a few
+    vectorized passes over uint64 lanes instead of one hash call per
+    position.
+
+    :param  seq: uint8 array of 2-bit base codes
+    :param  k: K-mer size
+    :return:    uint64 array with one hash per kmer
+    """
+    idx = np.arange(seq.size, dtype=np.uint64)
+    contrib = rotr64(NTH[seq], idx % np.uint64(64))
+    prefix = np.bitwise_xor.accumulate(contrib)
+    folded = prefix[k - 1:].copy()
+    folded[1:] ^= prefix[:-k]
+    return rotl64(folded,
+                  (idx[:folded.size] + np.uint64(k - 1)) % np.uint64(64))
+
+
+def decode_kmer(key, k):
+    """
+    Decodes a packed 2-bit uint64 key back into a kmer string
+    :param  key: packed kmer produced by scan_kmers
+    :param  k: K-mer size
+    """
+    bases = []
+    key = int(key)
+    for i in range(k):
+        bases.append('ACGT'[key & 3])
+        key >>= 2
+    return ''.join(reversed(bases))
 
 
 def check_positive(value):
@@ -54,6 +494,38 @@ def check_between_zero_one(value):
             '{} is not a floating point number'.format(value))
 
 
+def top_n(kmer_counter, n, k, packed):
+    """
+    Selects the n most frequent entries of a counter with one vectorized
+    partition instead of a heappushpop per entry, decoding only the
+    winners back to kmer strings
+    :param  kmer_counter: mapping of kmer keys to counts
+    :param  n: number of entries to keep
+    :param  k: K-mer size
+    :param  packed: True if the keys are packed uint64 kmers
+    :return:    list of n (count, kmer) tuples, padded with (0, '')
+    """
+    size = len(kmer_counter)
+    vals = np.fromiter(kmer_counter.values(), dtype=np.int64, count=size)
+    if packed:
+        keys = np.fromiter(kmer_counter.keys(), dtype=np.uint64, count=size)
+    else:
+        keys = np.array(list(kmer_counter.keys()), dtype=object)
+    if size > n:
+        idx = np.argpartition(-vals, n)[:n]
+        keys, vals = keys[idx], vals[idx]
+    heap = []
+    for count, kmer in zip(vals.tolist(), keys.tolist()):
+        if packed:
+            kmer = decode_kmer(kmer, k)
+        elif isinstance(kmer, bytes):  # binary partition lines
+            kmer = kmer.decode()
+        heap.append((count, kmer))
+    while len(heap) < n:  # pad as the heap-based selection did
+        heap.append((0, ''))
+    return heap
+
+
 def count_kmers(file_name, k, verbose=False):
     """
     Counts how many k-mers exists in a given file
@@ -63,13 +535,17 @@ def count_kmers(file_name, k, verbose=False):
     if verbose:
         start = time.time()
         print('Counting kmers in {}'.format(file_name))
-    total_kmers = 0
-    with open(file_name, 'r') as f:
-        line_num = 0
-        for line in f:
-            if line_num % 4 == 1:  # dna sequence
-                total_kmers += len(line) - k  # eliminate new-line
-            line_num += 1
+    if os.path.getsize(file_name) == 0:
+        return 0
+    with open(file_name, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # block-wise newline scan instead of a modulo test per line
+    arr = np.frombuffer(mm, dtype=np.uint8)
+    ends = newline_ends(arr)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # dna sequences are every fourth line starting from the second
+    seq_lengths = (ends - starts)[1::4]
+    total_kmers = int((seq_lengths - k + 1).sum())
     if verbose:
         end = time.time()
         print('{} kmers are counted in {:.2f} seconds'.format(
@@ -81,8 +557,8 @@ def parameters(total_kmers, target_disk, target_memory, k, verbose=False):
     """
     Calculates paramters
     :param  total_kmers: Number of total kmers in the file
-    :param  target_disk: Target disk space
-    :param  target_memory: Target memory
+    :param  target_disk: Target disk space in bits
+    :param  target_memory: Target memory in bits
     :param  k: K-mer size
     :return number_of_iterations: Number of iterations for DSK
             number_of_partitions: Number of partitions for DSK
@@ -95,8 +571,16 @@ def parameters(total_kmers, target_disk, target_memory, k, verbose=False):
         print('Target Disk: {:.2f}GB'.format(target_disk / 1024**3 / 8))
         print('Target Memory: {:.2f}GB'.format(target_memory / 1024**3 / 8))
 
-    b = (k + sys.getsizeof('')) * 8  # size of kmer in bits
-    b_disk = (k + 1) * 8  # size of kmer in disk in bits
+    # size of a kmer in memory and on disk, both in bits; packed kmers
+    # are fixed-width uint64 keys and 8-byte binary disk records, the
+    # old formula charged a full PyObject string header per kmer and
+    # drove the partition count far too high
+    if k <= 32:
+        b = 64  # packed uint64 key
+        b_disk = 64  # one binary record per kmer
+    else:
+        b = k * 8  # one byte per base
+        b_disk = (k + 1) * 8  # bases and the new line
     # max unique kmers
     if (4 ** k) < total_kmers:
         v = 4 ** k
@@ -108,9 +592,11 @@ def parameters(total_kmers, target_disk, target_memory, k, verbose=False):
         math.ceil((v * b) / (0.7 * target_memory * number_of_iterations)))
     use_dsk = 0.7 * target_memory < b * v
     # Bloom Filter Capacity
-    if dsk:
-        bf_capacity = total_kmers / (number_of_iterations *
-                                     number_of_partitions)
+    if use_dsk:
+        # partitions are hash-disjoint, so size per partition with a
+        # little headroom for routing skew
+        bf_capacity = total_kmers * 1.1 / (number_of_iterations *
+                                           number_of_partitions)
     else:
         bf_capacity = total_kmers
 
@@ -127,6 +613,55 @@ def parameters(total_kmers, target_disk, target_memory, k, verbose=False):
     return number_of_iterations, number_of_partitions, bf_capacity, use_dsk
 
 
+# per-process (bits, m, num_hashes) filter reused across partitions
+_WORKER_BF = None
+
+
+def process_partition(args):
+    """
+    Counts one dsk partition file and returns its top-n selection
+
+    Runs in a worker process. For k <= 32 the binary records are counted
+    exactly with one unique pass; otherwise a Bloom filter and a hash
+    table are used. The filter is sized once per worker and its bit
+    array is zeroed between partitions, so each process allocates one
+    filter for the whole run instead of one per task.
+
+    :param  args: (partition index, k, n, capacity, error_rate)
+    :return:    list of n (count, kmer) tuples, padded with (0, '')
+    """
+    global _WORKER_BF
+    j, k, n, capacity, error_rate = args
+    packed = k <= 32
+    if packed:
+        # a partition fits in memory by construction, so exact unique
+        # counting replaces the Bloom filter entirely
+        keys = np.fromfile(str(j), dtype=np.uint64)
+        unique, counts = np.unique(keys, return_counts=True)
+        kmer_counter = dict(zip(unique.tolist(), counts.tolist()))
+    else:
+        if _WORKER_BF is None:  # first partition in this process
+            _WORKER_BF = bloom_init(capacity, error_rate)
+        else:  # zeroing the bits beats re-allocating the filter
+            _WORKER_BF[0][:] = 0
+        bits, m_bits, num_hashes = _WORKER_BF
+        kmer_counter = defaultdict(lambda: 1)
+        # map the partition once and split the raw bytes instead of
+        # iterating a text-mode file, which decodes and newline-checks
+        # every character; keys stay bytes until the winners are decoded
+        if os.path.getsize(str(j)) > 0:
+            with open(str(j), 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            lines = mm[:].split(b'\n')
+            if lines and not lines[-1]:  # trailing new line
+                lines.pop()
+            for kmer in lines:
+                if bloom_test_set(bits, m_bits, num_hashes, kmer):
+                    kmer_counter[kmer] += 1  # in Bloom Filter
+    os.remove(str(j))
+    return top_n(kmer_counter, n, k, packed)
+
+
 def dsk(file_name, k, n, capacity, error_rate, iters, parts, verbose=False):
     """
     Implementation of DSK, k-mer counting with very low memory algorithm
@@ -142,11 +677,26 @@ def dsk(file_name, k, n, capacity, error_rate, iters, parts, verbose=False):
     if verbose:
         start = time.time()
 
+    packed = k <= 32  # packed uint64 keys fit for k <= 32
+    if packed:
+        route_scanner = make_route_scanner(k)  # compiled with k baked in
+
     # Assign functions to local variables for performance improvement
     hash_function = mmh3.hash
-    heap_pushpop = heapq.heappushpop
 
-    CHUNK_LIMIT = math.floor(capacity / 10)  # write approximately in 10 calls
+    # write approximately in 10 calls, but never let the buffer rows
+    # degenerate to zero length for tiny capacities
+    CHUNK_LIMIT = max(1, math.floor(capacity / 10))
+
+    # map the file once and locate every dna sequence with a
+    # block-wise newline scan; iterations then walk the same offsets
+    # instead of re-reading and re-parsing the file each time
+    with open(file_name, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    arr = np.frombuffer(mm, dtype=np.uint8)
+    ends = newline_ends(arr)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    seq_offsets = np.stack((starts[1::4], ends[1::4]), axis=1)
 
     heap = []
     for i in range(n):
@@ -155,43 +705,89 @@ def dsk(file_name, k, n, capacity, error_rate, iters, parts, verbose=False):
         if verbose:
             start_iter = time.time()
             print('Iteration#{} started.'.format(it + 1))
-        files = [open('{}'.format(j), 'w') for j in range(parts)]  # open files
+        # packed kmers go to raw binary files of 8-byte records,
+        # written through unbuffered descriptors one full row at a time
+        if packed:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+            fds = [os.open(str(j), flags, 0o644) for j in range(parts)]
+            files = []
+        else:
+            files = [open('{}'.format(j), 'w') for j in range(parts)]
+            # Assign functions to local variables for performance
+            writers = [files[j].write for j in range(parts)]
+            chunk_joiner = ''.join
 
         # Write to files in chunks to have less file.write calls
-        chunks = [[] for j in range(parts)]
-
-        # Assign functions to local variables for performance improvement
-        writers = [files[j].write for j in range(parts)]
-        chunk_appender = [chunks[j].append for j in range(parts)]
-        chunk_cleaner = [chunks[j].clear for j in range(parts)]
-        chunk_joiner = ''.join
-
-        with open(file_name, 'r') as f:
-            line_num = 0
-            for line in f:
-                if line_num % 4 == 1:  # dna sequence
-                    kmer_count = len(line) - k
-                    for i in range(kmer_count):
-                        kmer = line[i:i + k]
-                        h = hash_function(kmer)
-                        if h % iters == it:  # belongs to this iteration
-                            j = (h / iters) % parts
-                            _j = int(j)
-                            chunk_appender[_j](kmer + '\n')
-                            if len(chunks[_j]) == CHUNK_LIMIT:
-                                # write to file
-                                writers[_j](chunk_joiner(chunks[_j]))
-                                chunk_cleaner[_j]()
-                line_num += 1
+        if packed:
+            # one flat buffer with a contiguous row per partition,
+            # allocated once, instead of per-partition Python lists
+            # that reallocate on append
+            buf = np.empty((parts, CHUNK_LIMIT), dtype=np.uint64)
+            fills = [0 for j in range(parts)]  # used slots per row
+        else:
+            chunks = [[] for j in range(parts)]
+
+            # Assign functions to local variables for performance
+            chunk_appender = [chunks[j].append for j in range(parts)]
+            chunk_cleaner = [chunks[j].clear for j in range(parts)]
+
+        for s, e in seq_offsets.tolist():
+            if packed:
+                seq = ENC[arr[s:e]]  # zero-copy view of the mmap
+                if seq.size >= k:
+                    # packed keys and routing hashes from one pass; the
+                    # mixed ntHash keeps the partitions balanced,
+                    # unlike the raw packed values
+                    keys, hashes = route_scanner(seq)
+                    sel = hashes % np.uint64(iters) == np.uint64(it)
+                    routes = ((hashes[sel] // np.uint64(iters)) %
+                              np.uint64(parts)).astype(np.int64)
+                    keys = keys[sel]
+                    for j in np.unique(routes).tolist():
+                        picked = keys[routes == j]
+                        pos = 0
+                        while pos < picked.size:
+                            take = min(CHUNK_LIMIT - fills[j],
+                                       picked.size - pos)
+                            buf[j, fills[j]:fills[j] + take] = \
+                                picked[pos:pos + take]
+                            fills[j] += take
+                            pos += take
+                            if fills[j] == CHUNK_LIMIT:  # row is full
+                                os.write(fds[j], buf[j])
+                                fills[j] = 0
+            else:  # k > 32
+                line = arr[s:e].tobytes().decode('ascii')
+                kmer_count = len(line) - k + 1
+                for i in range(kmer_count):
+                    kmer = line[i:i + k]
+                    # mmh3.hash is signed, mask to unsigned so the
+                    # integer division below never sees a negative value
+                    h = hash_function(kmer) & 0xFFFFFFFF
+                    if h % iters == it:  # belongs to this iteration
+                        j = (h // iters) % parts
+                        chunk_appender[j](kmer + '\n')
+                        if len(chunks[j]) == CHUNK_LIMIT:
+                            # write to file
+                            writers[j](chunk_joiner(chunks[j]))
+                            chunk_cleaner[j]()
 
         # Write remaining kmers
         for j in range(parts):
-            writers[j](chunk_joiner(chunks[j]))
+            if packed:
+                if fills[j]:  # partially filled row
+                    os.write(fds[j], buf[j, :fills[j]])
+                os.close(fds[j])
+            else:
+                writers[j](chunk_joiner(chunks[j]))
 
         for f in files:
             f.close()  # close files
 
-        del chunks
+        if packed:
+            del buf
+        else:
+            del chunks
 
         if verbose:
             end_disk_write = time.time()
@@ -199,46 +795,29 @@ def dsk(file_name, k, n, capacity, error_rate, iters, parts, verbose=False):
                 end_disk_write - start_iter
             ))
 
-        for j in range(parts):
-            bf = BloomFilter(capacity, error_rate, 'kmer_bf')
-
-            kmer_counter = defaultdict(lambda: 1)
-
-            # Assign functions to local variables for performance improvement
-            add_to_bf = bf.add
-
-            if verbose:
-                start_partition = time.time()
-                print('Reading partition#{} started.'.format(j + 1))
-
-            with open(str(j), 'r') as f:
-                for kmer in f:
-                    if kmer not in bf:  # not in Bloom Filter
-                        add_to_bf(kmer)
-                    else:  # in Bloom Filter
-                        kmer_counter[kmer] += 1
-
-            if verbose:
-                end_partition = time.time()
-                print('Reading partition#{} is completed '.format(j + 1) +
-                      'in {:.2f} seconds.'.format(
-                      end_partition - start_partition))
-                start_populate = time.time()
-                print('Populating the heap...')
-
-            for kmer, count in kmer_counter.items():
-                # insert to the heap if count is bigger than minimum
-                if count > heap[0][0]:
-                    heap_pushpop(heap, (count, kmer.rstrip()))
-
-            if verbose:
-                end_populate = time.time()
-                print('Heap is populated in {:.2f} seconds.'.format(
-                    end_populate - start_populate
-                ))
-
-            os.remove(str(j))
-            os.remove('kmer_bf')
+        if verbose:
+            start_partitions = time.time()
+            print('Reading {} partitions...'.format(parts))
+
+        # partitions are fully independent (disjoint hash ranges), so
+        # they are counted in parallel worker processes
+        tasks = [(j, k, n, capacity, error_rate) for j in range(parts)]
+        workers = min(parts, os.cpu_count() or 1)
+        if workers > 1:
+            with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(process_partition, tasks))
+        else:  # no point in forking for a single partition
+            results = [process_partition(task) for task in tasks]
+
+        for part_top in results:
+            # merge each partition's top-n into the running selection;
+            # partitions are hash-disjoint so keys never repeat
+            heap = heapq.nlargest(n, heap + part_top)
+
+        if verbose:
+            end_partitions = time.time()
+            print('Partitions are read and merged in {:.2f} seconds.'.format(
+                end_partitions - start_partitions))
 
     if verbose:
         end = time.time()
@@ -261,43 +840,125 @@ def bf_counter(file_name, k, n, capacity, error_rate, verbose=False):
         start = time.time()
         print('BFCounter started.')
 
-    heap = []
-    for i in range(n):
-        heap.append((0, ''))
+    packed = k <= 32  # packed uint64 keys fit for k <= 32
+    # with numba one open-addressing table replaces the Bloom filter
+    # and the dict: a single probe both detects first sightings and
+    # counts repeats
+    use_table = packed and HAVE_NUMBA
 
-    bf = BloomFilter(capacity, error_rate, 'kmer_bf')
+    if use_table:
+        scanner = make_scanner(k)  # compiled with k baked in
+        table_keys, table_counts = table_init(capacity)
+        filled = 0
+    elif packed:  # in-memory bit array, probed one batch at a time
+        bits, m_bits, num_hashes = bloom_init(capacity, error_rate)
+        scanner = make_scanner(k)  # compiled with k baked in
+        kmer_counter = defaultdict(lambda: 1)
+    else:  # scalar bit-array filter keyed on the kmer strings
+        bits, m_bits, num_hashes = bloom_init(capacity, error_rate)
+        kmer_counter = defaultdict(lambda: 1)
 
-    kmer_counter = defaultdict(lambda: 1)
+    if packed:
+        batch_scanner = make_batch_scanner(k)
 
-    # Assign functions to local variables for performance improvement
-    add_to_bf = bf.add
-    heap_pushpop = heapq.heappushpop
+    if use_table:
+        def consume(keys):
+            # feed one flat array of packed keys into the table
+            nonlocal table_keys, table_counts, filled
+            # grow ahead of the insert so even an all-new batch stays
+            # below ~0.7 load and probes stay short
+            while (filled + keys.size) * 10 > table_keys.size * 7:
+                grown = table_init(table_keys.size)
+                table_rehash(table_keys, table_counts, *grown)
+                table_keys, table_counts = grown
+            filled += table_update(table_keys, table_counts, keys)
+    elif packed:
+        def consume(keys):
+            # collapse in-batch duplicates so one filter probe per
+            # distinct key covers the whole batch
+            keys, counts = np.unique(keys, return_counts=True)
+            exists = bloom_contains(bits, m_bits, num_hashes, keys)
+            bloom_add(bits, m_bits, num_hashes, keys[~exists])
+            for key, c, ex in zip(keys.tolist(), counts.tolist(),
+                                  exists.tolist()):
+                if ex:  # all c occurrences count
+                    kmer_counter[key] += c
+                elif c > 1:  # first occurrence armed the filter
+                    kmer_counter[key] += c - 1
+
+    def process_batch(lines):
+        # reads of one shared length stack into a matrix scanned
+        # row-parallel in a single call
+        length = len(lines[0])
+        if length >= k and all(len(line) == length for line in lines):
+            mat = np.frombuffer(''.join(lines).encode('ascii'),
+                                dtype=np.uint8).reshape(len(lines), length)
+            consume(batch_scanner(ENC[mat]).ravel())
+        else:  # heterogeneous read lengths, scan one read at a time
+            for line in lines:
+                seq = encode_seq(line)
+                if seq.size >= k:
+                    consume(scanner(seq))
 
     with open(file_name, 'r') as f:
-        line_num = 0
-        for line in f:
-            if line_num % 4 == 1:  # dna sequence
+        # read records four lines at a time instead of testing a modulo
+        # on every line
+        readline = f.readline
+        if packed:
+            batch = []
+            while True:
+                readline()  # sample id
+                line = readline()  # dna sequence
+                if not line:
+                    break
+                batch.append(line.rstrip('\n'))
+                if len(batch) == BATCH_READS:
+                    process_batch(batch)
+                    batch = []
+                readline()  # comment
+                readline()  # quality
+            if batch:  # remaining reads of a short final batch
+                process_batch(batch)
+        else:  # k > 32
+            while True:
+                readline()  # sample id
+                line = readline()  # dna sequence
+                if not line:
+                    break
                 kmer_count = len(line) - k
                 for i in range(kmer_count):
                     kmer = line[i:i + k]
-                    if kmer not in bf:  # not in Bloom Filter
-                        add_to_bf(kmer)
-                    else:  # in Bloom Filter
-                        kmer_counter[kmer] += 1
-            line_num += 1
+                    if bloom_test_set(bits, m_bits, num_hashes, kmer):
+                        kmer_counter[kmer] += 1  # in Bloom Filter
+                readline()  # comment
+                readline()  # quality
     if verbose:
         end_hash = time.time()
-        hash_table_size = sys.getsizeof(kmer_counter) / (1024 ** 2)
+        if use_table:
+            hash_table_size = (table_keys.nbytes +
+                               table_counts.nbytes) / (1024 ** 2)
+        else:
+            hash_table_size = sys.getsizeof(kmer_counter) / (1024 ** 2)
         print('Hash table is created in {:.2f} seconds.'.format(
             end_hash - start))
         print('Hash table size: {:.2f} MB.'.format(hash_table_size))
         start_populate = time.time()
         print('Populating the heap...')
 
-    for count, kmer in kmer_counter.items():
-        # insert to the heap if count is bigger than minimum
-        if count > heap[0][0]:
-            heap_pushpop(heap, (count, kmer))
+    if use_table:
+        # select straight from the table arrays, occupied slots only
+        occupied = np.flatnonzero(table_counts)
+        vals = table_counts[occupied].astype(np.int64)
+        keys = table_keys[occupied]
+        if vals.size > n:
+            idx = np.argpartition(-vals, n)[:n]
+            vals, keys = vals[idx], keys[idx]
+        heap = [(count, decode_kmer(key, k))
+                for count, key in zip(vals.tolist(), keys.tolist())]
+        while len(heap) < n:  # pad as the heap-based selection did
+            heap.append((0, ''))
+    else:
+        heap = top_n(kmer_counter, n, k, packed)
 
     if verbose:
         end_populate = time.time()
@@ -305,7 +966,6 @@ def bf_counter(file_name, k, n, capacity, error_rate, verbose=False):
             end_populate - start_populate
         ))
 
-    os.remove('kmer_bf')
     if verbose:
         end = time.time()
         print('BFCounter is completed in {:.2f} seconds.'.format(end - start))